@@ -2,64 +2,45 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import base64
+import os
+from pathlib import Path
 
 # === Load Logo ===
-with open("FSD LOGO.png", "rb") as f:
-    encoded_image = base64.b64encode(f.read()).decode("utf-8")
-logo_path = f"data:image/png;base64,{encoded_image}"
+@st.cache_resource
+def load_logo():
+    with open("FSD LOGO.png", "rb") as f:
+        encoded_image = base64.b64encode(f.read()).decode("utf-8")
+    return f"data:image/png;base64,{encoded_image}"
+
+logo_path = load_logo()
 
 # === Constants ===
 FIXED_COST_PER_LB = 13044792 / 17562606
 TRANSPORT_COST_PER_LB_PER_MILE = 0.01
 DONATED_COST = 0.04
+BP_PURCHASED_COST_PER_LB = 1.27
 
 # === Default Cost Guardrails ===
 # If the calculated ratios yield N/a or Negative values, these take the place to preserve model functionality
 DEFAULT_PURCHASED_COST_PER_LB = 1.00
 DEFAULT_PRODUCE_COST_PER_LB = 0.75
 
-# === Load Data ===
-quarterly_path = 'Final_Quarterly_Data.xlsx'
-quarter_df = pd.read_excel(quarterly_path)
-
-lbs_per_hh_model = {
-    'AGENCY': {'produce': 16, 'purchased': 5, 'donated': 2},
-    'BP': {'produce': 4, 'purchased': 4, 'donated': 4},
-    'MP': {'produce': 16, 'purchased': 5, 'donated': 2},
-    'PP': {'produce': 24, 'purchased': 0, 'donated': 0},
-    'SP': {'produce': 16, 'purchased': 5, 'donated': 2}
-}
+# === Program Model (lbs per HH) ===
+# One row per program in PROGS order: produce, purchased, donated
+PROGS = ('AGENCY', 'BP', 'MP', 'PP', 'SP')
+LBS = np.array([
+    (16, 5, 2),
+    (4, 4, 4),
+    (16, 5, 2),
+    (24, 0, 0),
+    (16, 5, 2)
+], dtype=np.int32)
+PROG_INDEX = {prog: i for i, prog in enumerate(PROGS)}
 
 # === Calculate Food Ratios ===
-program_food_ratios = {}
-for prog, values in lbs_per_hh_model.items():
-    total = sum(v for v in values.values() if v is not None)
-    program_food_ratios[prog] = {
-        'produce_ratio': (values['produce'] or 0) / total if total else 0,
-        'purchased_ratio': (values['purchased'] or 0) / total if total else 0,
-        'donated_ratio': (values['donated'] or 0) / total if total else 0
-    }
-
-# === Apply Ratios to Historical Data ===
-quarter_df = quarter_df[quarter_df['Cost'] > 1]
-estimated_weights = quarter_df.apply(
-    lambda row: pd.Series({
-        'Estimated_Produce_Weight': row['Weight'] * program_food_ratios.get(row['PROGRAM'], {}).get('produce_ratio', 0),
-        'Estimated_Purchased_Weight': row['Weight'] * program_food_ratios.get(row['PROGRAM'], {}).get('purchased_ratio', 0),
-        'Estimated_Donated_Weight': row['Weight'] * program_food_ratios.get(row['PROGRAM'], {}).get('donated_ratio', 0),
-    }),
-    axis=1
-)
-quarter_df = pd.concat([quarter_df, estimated_weights], axis=1)
-
-# === Aggregate by Program ===
-program_agg = quarter_df.groupby('PROGRAM').agg({
-    'Cost': 'sum',
-    'Weight': 'sum',
-    'Estimated_Produce_Weight': 'sum',
-    'Estimated_Purchased_Weight': 'sum',
-    'Estimated_Donated_Weight': 'sum'
-}).reset_index()
+# Programs whose lbs are all zero keep zero ratios
+lbs_totals = LBS.sum(axis=1, keepdims=True)
+RATIOS = np.divide(LBS, lbs_totals, out=np.zeros(LBS.shape, dtype=np.float32), where=lbs_totals > 0, dtype=np.float32)
 
 # === Backsolve Costs ===
 # This is the main source of errors - known limitations include: 
@@ -69,141 +50,209 @@ program_agg = quarter_df.groupby('PROGRAM').agg({
 # Current workarounds include:
 # 1. A set $/Lb price floor to prevent N/a and Negative or Zero Values
 # 2. Default $/Lb for Produce and Purchased to apply in all Programs when dynamic historical backsolving fails
+# 3. When a Program has both Produce and Purchased weight, Purchased $/Lb is the value in 0.5 - 1.2 closest to the
+#    Default Purchased $/Lb that still keeps Produce $/Lb at or above its floor. If the default is out of reach,
+#    Produce $/Lb lands exactly on the 0.10 floor (e.g. SP) - this is intended, not a backsolving failure
 
 # === Recommended Improvements: ===
 # 1. Replace Backsolving with Constrained Optimization 
 # ie. Minimize error by building a linear optimization model to find closest realistic Cost per Lb
 
-results = []
-for _, row in program_agg.iterrows():
-    prog = row['PROGRAM']
-    total_cost = row['Cost']
-    total_weight = row['Weight']
-    prod_wt, purch_wt, don_wt = row[['Estimated_Produce_Weight', 'Estimated_Purchased_Weight', 'Estimated_Donated_Weight']]
-
-    blended_cost = total_cost / total_weight if total_weight else 0
-    rprod = prod_wt / total_weight if total_weight else 0
-    rpurch = purch_wt / total_weight if total_weight else 0
-    rdon = don_wt / total_weight if total_weight else 0
-
-    x = y = None
-    if prog != 'BP' and (rprod > 0 and rpurch > 0):
-        candidate_ys = np.linspace(0.5, 1.2, 71)
-        best_error = float('inf')
-        for candidate_y in candidate_ys:
-            candidate_x = (blended_cost - rpurch * candidate_y - rdon * DONATED_COST) / rprod
-            #Setting a Price Floor for Purchased Costs / Pound
-            candidate_x = max(candidate_x, 0.10)
-            reconstructed = rprod * candidate_x + rpurch * candidate_y + rdon * DONATED_COST
-            error = abs(reconstructed - blended_cost)
-            if error < best_error:
-                best_error = error
-                x, y = candidate_x, candidate_y
-    elif rpurch > 0 and rprod == 0:
-        y = (blended_cost - rdon * DONATED_COST) / rpurch
-        y = max(0.5, min(1.2, y))
-    elif rprod > 0 and rpurch == 0:
-        x = (blended_cost - rdon * DONATED_COST) / rprod
-        # Setting a Price Floor for Purchased Costs / Pound
-        x = max(x, 0.10)
-    else: 
-        # Validating that X for Purchased Cost/Lb is a non-zero value
-        x = 0.10 if x is None else max(x, 0.10)
-
-    results.append({
-        'PROGRAM': prog,
+def backsolve(costs, weights, prod_wts, purch_wts, don_wts, is_bp):
+    # Solves every program at once from aligned per-program arrays; NaN marks a cost that could not be backsolved
+    with np.errstate(divide='ignore', invalid='ignore'):
+        blended_cost = np.where(weights != 0, costs / weights, 0)
+        rprod = np.where(weights != 0, prod_wts / weights, 0)
+        rpurch = np.where(weights != 0, purch_wts / weights, 0)
+        rdon = np.where(weights != 0, don_wts / weights, 0)
+
+        # Any y that keeps x at or above the price floor reconstructs the blended cost exactly,
+        # so take the default purchased $/Lb clipped to that range (and to the 0.5 - 1.2 band)
+        y_max = (blended_cost - rdon * DONATED_COST - rprod * 0.10) / rpurch
+        y_both = np.clip(DEFAULT_PURCHASED_COST_PER_LB, 0.5, np.clip(y_max, 0.5, 1.2))
+        x_both = (blended_cost - rpurch * y_both - rdon * DONATED_COST) / rprod
+        y_purch_only = (blended_cost - rdon * DONATED_COST) / rpurch
+        x_prod_only = (blended_cost - rdon * DONATED_COST) / rprod
+
+    both = ~is_bp & (rprod > 0) & (rpurch > 0)
+    purch_only = (rpurch > 0) & (rprod == 0)
+    prod_only = (rprod > 0) & (rpurch == 0)
+
+    # Setting a Price Floor for Produce Costs / Pound, which also covers programs with nothing to backsolve
+    x = np.select([both, purch_only, prod_only], [np.maximum(x_both, 0.10), np.nan, np.maximum(x_prod_only, 0.10)], default=0.10)
+    y = np.select([both, purch_only], [y_both, np.clip(y_purch_only, 0.5, 1.2)], default=np.nan)
+    return x, y
+
+# === Load Data ===
+# The workbook is cached as Parquet on first use (and whenever the workbook is newer), since parsing .xlsx
+# is by far the slowest part of startup. The workbook stays the source of truth: an unreadable or unwritable
+# cache just means reading the workbook instead
+def load_quarterly_data():
+    columns = ['PROGRAM', 'Cost', 'Weight']
+    quarterly_path = Path('Final_Quarterly_Data.xlsx')
+    parquet_path = quarterly_path.with_suffix('.parquet')
+
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= quarterly_path.stat().st_mtime:
+        try:
+            return pd.read_parquet(parquet_path, columns=columns)
+        except (OSError, ValueError, ImportError):
+            pass
+
+    quarter_df = pd.read_excel(quarterly_path, usecols=columns)
+    # Write to a temp file and swap it in, so a failed or interrupted write never leaves a truncated cache behind
+    tmp_path = parquet_path.with_name(f"{parquet_path.name}.{os.getpid()}.tmp")
+    try:
+        quarter_df.to_parquet(tmp_path)
+        os.replace(tmp_path, parquet_path)
+    except (OSError, ValueError, ImportError):
+        tmp_path.unlink(missing_ok=True)
+    return quarter_df
+
+# === Historical Cost Estimates ===
+# Cached so the Excel load, aggregation and backsolve run once per server process rather than on every rerun
+@st.cache_data
+def load_cost_estimates():
+    # === Load Data ===
+    quarter_df = load_quarterly_data()
+
+    # === Aggregate by Program ===
+    # Sort rows by program once, then sum each contiguous program run with np.add.reduceat;
+    # like groupby().sum(), rows without a program are dropped and missing amounts count as zero
+    quarter_df = quarter_df.loc[(quarter_df['Cost'] > 1) & quarter_df['PROGRAM'].notna(), ['PROGRAM', 'Cost', 'Weight']]
+    programs = quarter_df['PROGRAM'].to_numpy()
+    order = np.argsort(programs, kind='stable')
+    progs, starts = np.unique(programs[order], return_index=True)
+    program_agg = pd.DataFrame({'PROGRAM': progs})
+    for col in ['Cost', 'Weight']:
+        program_agg[col] = np.add.reduceat(np.nan_to_num(quarter_df[col].to_numpy()[order]), starts)
+
+    # === Apply Ratios to Historical Data ===
+    # Ratios are constant within a program, so its estimated weights are its total weight split by ratio;
+    # programs outside the model keep zero ratios
+    idx = program_agg['PROGRAM'].map(PROG_INDEX).fillna(-1).to_numpy(dtype=int)
+    mask = idx >= 0
+    prog_ratios = np.zeros((len(idx), 3))
+    prog_ratios[mask] = RATIOS[idx[mask]]
+    program_agg[['Estimated_Produce_Weight', 'Estimated_Purchased_Weight', 'Estimated_Donated_Weight']] = program_agg['Weight'].to_numpy()[:, None] * prog_ratios
+
+    # === Backsolve Costs ===
+    agg_cols = ['Cost', 'Weight', 'Estimated_Produce_Weight', 'Estimated_Purchased_Weight', 'Estimated_Donated_Weight']
+    x, y = backsolve(*program_agg[agg_cols].to_numpy().T, program_agg['PROGRAM'].to_numpy() == 'BP')
+
+    # === Apply Guardrails ===
+    # Defaults fill any cost that could not be backsolved; purchased $/Lb is held to the same 0.5 - 1.2 band everywhere
+    np.copyto(x, DEFAULT_PRODUCE_COST_PER_LB, where=np.isnan(x))
+    np.copyto(y, DEFAULT_PURCHASED_COST_PER_LB, where=np.isnan(y))
+    np.clip(y, 0.5, 1.2, out=y)
+
+    cost_estimates = pd.DataFrame({
+        'PROGRAM': program_agg['PROGRAM'],
         'estimated_produce_cost_per_lb': x,
         'estimated_purchased_cost_per_lb': y
     })
 
-cost_estimates = pd.DataFrame(results)
-
-# === Apply Guardrails ===
-cost_estimates['estimated_produce_cost_per_lb'] = cost_estimates['estimated_produce_cost_per_lb'].fillna(DEFAULT_PRODUCE_COST_PER_LB)
-cost_estimates['estimated_purchased_cost_per_lb'] = cost_estimates['estimated_purchased_cost_per_lb'].fillna(DEFAULT_PURCHASED_COST_PER_LB)
+    return cost_estimates
+
+# Every modeled program resolves straight to (produce $/Lb, purchased $/Lb), with the defaults and the BP override baked in
+@st.cache_data
+def load_cost_lookup():
+    cost_estimates = load_cost_estimates()
+    cost_lookup = {prog: (DEFAULT_PRODUCE_COST_PER_LB, DEFAULT_PURCHASED_COST_PER_LB) for prog in PROGS}
+    cost_lookup.update(zip(
+        cost_estimates['PROGRAM'],
+        zip(cost_estimates['estimated_produce_cost_per_lb'].tolist(), cost_estimates['estimated_purchased_cost_per_lb'].tolist())
+    ))
+    cost_lookup['BP'] = (cost_lookup['BP'][0], BP_PURCHASED_COST_PER_LB)
+    return cost_lookup
+
+# === Delivery Cost Model ===
+# hh and miles may be scalars or broadcastable arrays, so one call can price a whole grid of scenarios
+def delivery_costs(lbs_per_hh, costs, hh, miles, deliveries):
+    total_lbs = lbs_per_hh.sum() * hh
+    base_cost = (lbs_per_hh @ costs) * hh
+    fixed_cost = total_lbs * FIXED_COST_PER_LB
+    transport_cost = total_lbs * miles * TRANSPORT_COST_PER_LB_PER_MILE
+    delivery_cost = base_cost + transport_cost
+    total_cost = delivery_cost * deliveries + fixed_cost
+    return total_lbs, base_cost, fixed_cost, transport_cost, delivery_cost, total_cost
 
 # === Streamlit UI ===
 st.markdown(f"<div style='text-align: center;'><img src='{logo_path}' style='height: 140px; margin-bottom: 20px;'></div>", unsafe_allow_html=True)
 st.title("Cost Calculator")
 
 with st.form("calculator_form"):
-    program = st.selectbox("1. Which program is this?", list(lbs_per_hh_model.keys()))
+    program = st.selectbox("1. Which program is this?", PROGS)
+    default_produce_lb, default_purchased_lb, default_donated_lb = LBS[PROG_INDEX[program]].tolist()
     hh = st.number_input("2. How many households are served per delivery?", min_value=1, value=350)
     deliveries = st.number_input("3. How many annual deliveries will this program receive?", min_value=1, value=12)
 
-    produce_lb = st.number_input("4. How many lbs of produce per HH?", min_value=0.0, value=float(lbs_per_hh_model[program]['produce']))
-    purchased_lb = st.number_input("5. How many lbs of purchased per HH?", min_value=0.0, value=float(lbs_per_hh_model[program]['purchased']))
-    donated_lb = st.number_input("6. How many lbs of donated per HH?", min_value=0.0, value=float(lbs_per_hh_model[program]['donated']))
+    produce_lb = st.number_input("4. How many lbs of produce per HH?", min_value=0.0, value=float(default_produce_lb))
+    purchased_lb = st.number_input("5. How many lbs of purchased per HH?", min_value=0.0, value=float(default_purchased_lb))
+    donated_lb = st.number_input("6. How many lbs of donated per HH?", min_value=0.0, value=float(default_donated_lb))
     miles = st.number_input("7. How many miles will this delivery travel?", min_value=0.0, value=30.0)
 
+    sweep = st.checkbox("8. Compare annual cost across a range of households and distances?")
+    hh_range = st.slider("Households per delivery range", min_value=1, max_value=2000, value=(100, 1000))
+    miles_range = st.slider("Distance range (miles)", min_value=0, max_value=200, value=(0, 100))
+
     submitted = st.form_submit_button("Calculate & Estimate")
 
 if submitted:
-    match = cost_estimates[cost_estimates['PROGRAM'] == program]
-    agg_row = program_agg[program_agg['PROGRAM'] == program].iloc[0]
-
-    if match.empty:
-        produce_cost = DEFAULT_PRODUCE_COST_PER_LB
-        purchased_cost = DEFAULT_PURCHASED_COST_PER_LB
-    else:
-        row = match.iloc[0]
-        if program == 'BP':
-            purchased_cost = 1.27
-            if pd.notna(row['estimated_produce_cost_per_lb']):
-                produce_cost = row['estimated_produce_cost_per_lb']
-            else:
-                blended = agg_row['Cost'] / agg_row['Weight'] if agg_row['Weight'] > 0 else 0
-                r = 1 / 3
-                produce_cost = (blended - (r * 1.27 + r * DONATED_COST)) / r
-        else:
-            produce_cost = row['estimated_produce_cost_per_lb']
-            purchased_cost = row['estimated_purchased_cost_per_lb']
-
-    prod_total = produce_lb * hh
-    purch_total = purchased_lb * hh
-    don_total = donated_lb * hh
-    total_lbs = prod_total + purch_total + don_total
-
-    base_cost = prod_total * produce_cost + purch_total * purchased_cost + don_total * DONATED_COST
-    fixed_cost = total_lbs * FIXED_COST_PER_LB
-    transport_cost = total_lbs * miles * TRANSPORT_COST_PER_LB_PER_MILE
-    delivery_cost = base_cost + transport_cost
-    total_cost = delivery_cost * deliveries + fixed_cost
+    # Historical estimates are only needed once the form is submitted, so the first render skips loading them
+    produce_cost, purchased_cost = load_cost_lookup()[program]
+
+    # Produce / purchased / donated lbs per HH against their $/Lb
+    lbs_per_hh = np.array([produce_lb, purchased_lb, donated_lb])
+    costs = np.array([produce_cost, purchased_cost, DONATED_COST])
+    total_lbs, base_cost, fixed_cost, transport_cost, delivery_cost, total_cost = delivery_costs(lbs_per_hh, costs, hh, miles, deliveries)
     total_annual_lbs = total_lbs * deliveries
     blended_annual_cost_per_lb = total_cost / total_annual_lbs if total_annual_lbs else 0
 
     st.markdown(f"""
 ### Calculation Completed
 
-#### <strong>User Inputs</strong>
-<p><strong>Program:</strong> {program}</p>
-<p><strong>Households per Delivery:</strong> {hh}</p>
-<p><strong>Deliveries per Year:</strong> {deliveries}</p>
-<p><strong>Produce per HH:</strong> {produce_lb}</p>
-<p><strong>Purchased per HH:</strong> {purchased_lb}</p>
-<p><strong>Donated per HH:</strong> {donated_lb}</p>
-<p><strong>Distance:</strong> {miles} miles</p>
+#### User Inputs
+- **Program:** {program}
+- **Households per Delivery:** {hh}
+- **Deliveries per Year:** {deliveries}
+- **Produce per HH:** {produce_lb}
+- **Purchased per HH:** {purchased_lb}
+- **Donated per HH:** {donated_lb}
+- **Distance:** {miles} miles
 
 ---
 
-#### <strong>Calculator Outputs</strong>
-<p><strong>Total Weight per Delivery:</strong> {total_lbs:.2f} lbs</p>
-<p><strong>Base Food Cost per Delivery:</strong> ${base_cost:.2f}</p>
-<p><strong>Annual Fixed (Setup) Cost (@ {FIXED_COST_PER_LB:.4f}/lb):</strong> ${fixed_cost:.2f}</p>
-<p><strong>Transport Cost per Delivery (@ $0.01/lb/mile):</strong> ${transport_cost:.2f}</p>
+#### Calculator Outputs
+- **Total Weight per Delivery:** {total_lbs:.2f} lbs
+- **Base Food Cost per Delivery:** \\${base_cost:.2f}
+- **Annual Fixed (Setup) Cost (@ {FIXED_COST_PER_LB:.4f}/lb):** \\${fixed_cost:.2f}
+- **Transport Cost per Delivery (@ \\$0.01/lb/mile):** \\${transport_cost:.2f}
 
 ---
 
-#### <strong>Food Cost Per lb Per HH</strong>
-<p><strong>Produce:</strong> {produce_lb} lbs × ${produce_cost:.3f} = ${produce_lb * produce_cost:.2f} per HH</p>
-<p><strong>Purchased:</strong> {purchased_lb} lbs × ${purchased_cost:.3f} = ${purchased_lb * purchased_cost:.2f} per HH</p>
-<p><strong>Donated:</strong> {donated_lb} lbs × ${DONATED_COST:.2f} = ${donated_lb * DONATED_COST:.2f} per HH</p>
+#### Food Cost Per lb Per HH
+- **Produce:** {produce_lb} lbs × \\${produce_cost:.3f} = \\${produce_lb * produce_cost:.2f} per HH
+- **Purchased:** {purchased_lb} lbs × \\${purchased_cost:.3f} = \\${purchased_lb * purchased_cost:.2f} per HH
+- **Donated:** {donated_lb} lbs × \\${DONATED_COST:.2f} = \\${donated_lb * DONATED_COST:.2f} per HH
 
 ---
 
-#### <strong>Final Outputs</strong>
-<p><strong>Total Cost per Delivery (Food + Transport):</strong> ${delivery_cost:.2f}</p>
-<p><strong>Total Annual Cost:</strong> ${total_cost:.2f}</p>
-<p><strong>Total Annual Lbs Distributed:</strong> {total_annual_lbs:.2f} lbs</p>
-<p><strong>Blended Annual Cost per lb:</strong> ${blended_annual_cost_per_lb:.4f}</p>
-""", unsafe_allow_html=True)
+#### Final Outputs
+- **Total Cost per Delivery (Food + Transport):** \\${delivery_cost:.2f}
+- **Total Annual Cost:** \\${total_cost:.2f}
+- **Total Annual Lbs Distributed:** {total_annual_lbs:.2f} lbs
+- **Blended Annual Cost per lb:** \\${blended_annual_cost_per_lb:.4f}
+""")
+
+    if sweep:
+        # Whole-number grid points, deduplicated so narrow slider ranges still give unique row and column labels
+        hhs = np.unique(np.linspace(*hh_range, 10).round().astype(int))
+        miles_arr = np.unique(np.linspace(*miles_range, 11).round().astype(int))
+        sweep_total_cost = delivery_costs(lbs_per_hh, costs, hhs[:, None], miles_arr[None, :], deliveries)[-1]
+
+        st.markdown("#### Total Annual Cost by Households and Distance")
+        st.dataframe(pd.DataFrame(
+            sweep_total_cost,
+            index=pd.Index(hhs, name='Households'),
+            columns=[f"{m} mi" for m in miles_arr]
+        ).style.format("${:,.0f}"))